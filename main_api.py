@@ -1,11 +1,18 @@
 import sys
 import os
-import base64
+import re
+import pybase64
+import asyncio
+import hashlib
+from collections import OrderedDict
 from typing import List
+import numpy as np
+import orjson
 from contextlib import asynccontextmanager # <--- NEW IMPORT
 from fastapi import FastAPI, UploadFile, File, Form
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,8 +20,10 @@ load_dotenv()
 # IMPORTS
 from scripts.youtube_engine import get_relevant_video
 import scripts.history_manager as hm # Import the whole module
+from scripts._model import encode_batch
 from scripts.web_image_engine import get_google_images
-from groq import Groq
+from groq import Groq, AsyncGroq
+import httpx
 
 # CONFIGURATION
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -30,7 +39,12 @@ async def lifespan(app: FastAPI):
     # STARTUP: Connect to DB
     print("Starting up... Connecting to Database.")
     hm.init_client()
+    warm_up()
+    global encode_queue
+    encode_queue = asyncio.Queue()
+    batch_worker = asyncio.create_task(encode_batch_worker())
     yield
+    batch_worker.cancel()
     # SHUTDOWN: Close DB
     print("Shutting down... Closing Database.")
     try:
@@ -42,8 +56,27 @@ async def lifespan(app: FastAPI):
             print(f"Warning during shutdown: {e}")
 
 # INITIALIZE APP WITH LIFESPAN
-app = FastAPI(lifespan=lifespan)
-groq_client = Groq(api_key=GROQ_API_KEY)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+# Shared keep-alive connection pool for all Groq calls
+groq_client = Groq(
+    api_key=GROQ_API_KEY,
+    http_client=httpx.Client(limits=httpx.Limits(max_connections=50, max_keepalive_connections=20))
+)
+# Async client for token streaming (/stream-lesson)
+async_groq_client = AsyncGroq(
+    api_key=GROQ_API_KEY,
+    http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=50, max_keepalive_connections=20))
+)
+
+def warm_up():
+    """Runs the first encode and opens the Groq connection before any user request."""
+    try:
+        hm.encoder.encode("warmup")
+        hm.text_encoder.encode("warmup")
+        groq_client.models.list()  # TLS handshake without spending tokens
+        print("Encoders and Groq connection warmed up")
+    except Exception as e:
+        print(f"WARNING: Warm-up failed: {e}")
 
 # ALLOW FRONTEND
 app.add_middleware(
@@ -65,78 +98,263 @@ class QueryRequest(BaseModel):
     language: str = "English"
 
 def encode_image(image_bytes):
-    return base64.b64encode(image_bytes).decode('utf-8')
+    """Builds the base64 data URL for an image (SIMD-accelerated, single decode)."""
+    return (b"data:image/jpeg;base64," + pybase64.b64encode(image_bytes)).decode('ascii')
+
+# UPLOAD LIMITS (/explain-image)
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# --- SEMANTIC CACHE ---
+# Near-duplicate questions (same language and difficulty) reuse the previous
+# lesson instead of re-running the search + LLM pipeline. Unit vectors live in
+# one preallocated matrix (a row per slot), so a lookup is a single
+# matrix-vector product.
+SEMANTIC_CACHE_SIZE = 256
+SEMANTIC_CACHE_THRESHOLD = 0.92
+semantic_cache = OrderedDict()  # (language, level, query) -> (slot, response)
+_cache_matrix = None  # (SEMANTIC_CACHE_SIZE, dim), allocated on first insert
+_cache_slot_keys = [None] * SEMANTIC_CACHE_SIZE
+
+# The frontend sends "<topic> (Explain at <level> level)"
+LEVEL_SUFFIX = re.compile(r"\s*\(Explain at (\w+) level\)\s*$")
+
+def split_level(query):
+    """Splits a query into (topic, difficulty level); the level is "" if absent."""
+    match = LEVEL_SUFFIX.search(query)
+    if match is None:
+        return query, ""
+    return query[:match.start()], match.group(1)
+
+def lookup_semantic_cache(unit_vector, language, level):
+    """Returns the cached response of the most similar past query, or None.
+
+    `unit_vector` embeds the topic only; language and level must match exactly.
+    """
+    if _cache_matrix is None:
+        return None
+    scores = _cache_matrix @ unit_vector  # empty slots are zero rows
+    hits = np.flatnonzero(scores >= SEMANTIC_CACHE_THRESHOLD)
+    for slot in hits[np.argsort(scores[hits])[::-1]]:
+        key = _cache_slot_keys[slot]
+        if key is not None and key[:2] == (language, level):
+            semantic_cache.move_to_end(key)
+            return semantic_cache[key][1]
+    return None
+
+def store_semantic_cache(unit_vector, language, level, query, response):
+    """Adds a response to the cache, evicting the least recently used entry."""
+    global _cache_matrix
+    if _cache_matrix is None:
+        _cache_matrix = np.zeros((SEMANTIC_CACHE_SIZE, len(unit_vector)), dtype=np.float32)
+
+    key = (language, level, query)
+    if key in semantic_cache:
+        slot = semantic_cache[key][0]
+    elif len(semantic_cache) >= SEMANTIC_CACHE_SIZE:
+        _, (slot, _) = semantic_cache.popitem(last=False)
+    else:
+        slot = len(semantic_cache)
+
+    _cache_matrix[slot] = unit_vector
+    _cache_slot_keys[slot] = key
+    semantic_cache[key] = (slot, response)
+    semantic_cache.move_to_end(key)
+
+# --- ENCODER MICRO-BATCHING ---
+# Queries arriving within a few ms of each other share one encoder call
+ENCODE_BATCH_WINDOW = 0.005  # seconds
+ENCODE_BATCH_SIZE = 16
+encode_queue = None  # created in lifespan: (text, model, future) items
+
+async def encode_batch_worker():
+    """Collects pending encode requests and runs them as one batch per model."""
+    while True:
+        batch = [await encode_queue.get()]
+        await asyncio.sleep(ENCODE_BATCH_WINDOW)
+        while len(batch) < ENCODE_BATCH_SIZE and not encode_queue.empty():
+            batch.append(encode_queue.get_nowait())
+
+        for model in {item[1] for item in batch}:
+            items = [(text, fut) for text, item_model, fut in batch if item_model == model]
+            try:
+                vectors = await asyncio.to_thread(encode_batch, [text for text, _ in items], model)
+            except Exception:
+                # One bad text must not fail the queries it was batched with: retry one at a time
+                vectors = None
+            if vectors is not None:
+                for (_, fut), vector in zip(items, vectors):
+                    if not fut.done():
+                        fut.set_result(vector)
+                continue
+            for text, fut in items:
+                try:
+                    vector = (await asyncio.to_thread(encode_batch, [text], model))[0]
+                    if not fut.done():
+                        fut.set_result(vector)
+                except Exception as e:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+async def encode_query(text, model="text"):
+    """Encodes a query through the micro-batching worker."""
+    fut = asyncio.get_running_loop().create_future()
+    await encode_queue.put((text, model, fut))
+    return await fut
+
+# --- CONCURRENCY HELPERS ---
+# Fire-and-forget tasks are kept referenced here until they finish
+background_tasks = set()
+
+def run_in_background(func, *args):
+    """Runs a blocking call in a worker thread without waiting for it."""
+    async def runner():
+        try:
+            await asyncio.to_thread(func, *args)
+        except Exception as e:
+            print(f"WARNING: Background task {func.__name__} failed: {e}")
+
+    task = asyncio.create_task(runner())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def generate_answer(messages):
+    """Generates the lesson text. Returns (answer, generated_successfully)."""
+    try:
+        chat = await asyncio.to_thread(
+            groq_client.chat.completions.create,
+            messages=messages,
+            model="llama-3.3-70b-versatile",
+        )
+        print("AI response generated successfully")
+        return chat.choices[0].message.content, True
+    except Exception as e:
+        error_msg = f"ERROR: AI generation failed: {str(e)}"
+        print(error_msg)
+        return f"I'm having trouble thinking right now. Error: {str(e)}", False
+
+async def find_textbook_images(user_query, limit=2):
+    """Encodes the query into CLIP space and searches the textbook diagrams.
+
+    Returns [] on failure, so the lesson falls back to web images.
+    """
+    try:
+        image_vector = await encode_query(user_query, "clip")
+    except Exception as e:
+        print(f"WARNING: CLIP encoding failed: {e}")
+        return []
+    return await asyncio.to_thread(hm.search_images, image_vector, limit=limit)
+
+async def fetch_video(user_query):
+    """Looks up a YouTube video without blocking the event loop."""
+    try:
+        return await asyncio.to_thread(get_relevant_video, user_query, YOUTUBE_API_KEY)
+    except Exception as e:
+        print(f"WARNING: Error in video: {e}")
+        return None
+
+async def fetch_web_images(user_query):
+    """Searches web images without blocking the event loop."""
+    print("Not enough local images, searching web...")
+    try:
+        return await asyncio.to_thread(get_google_images, user_query)
+    except Exception as e:
+        print(f"WARNING: Web image search failed: {e}")
+        return []
 
 # --- ENDPOINTS ---
 
+# Identical requests already being answered: sha1(query|language) -> task
+inflight_lessons = {}
+
 @app.post("/get-lesson")
 async def get_lesson(request: QueryRequest):
+    # Concurrent identical questions share one pipeline run (single-flight)
+    key = hashlib.sha1(f"{request.query}|{request.language}".encode('utf-8')).digest()
+    task = inflight_lessons.get(key)
+    if task is None:
+        task = asyncio.create_task(build_lesson(request))
+        inflight_lessons[key] = task
+        task.add_done_callback(lambda _: inflight_lessons.pop(key, None))
+    else:
+        print(f"\nRequest: '{request.query}' (joining identical in-flight request)")
+    # shield: a disconnecting client must not cancel the shared work
+    return await asyncio.shield(task)
+
+async def prepare_lesson(request):
+    """Checks the database, encodes the query and collects textbook context.
+
+    Returns (response, None) when the request can be answered right away (an
+    error or a semantic cache hit), otherwise (None, lesson) with what the
+    generation step needs.
+    """
     user_query = request.query
     print(f"\nRequest: '{user_query}'")
 
     # Check if client and encoder are initialized
-    if not hm.client or not hm.encoder:
+    if not hm.client or not hm.encoder or not hm.text_encoder:
         error_msg = "ERROR: Database not initialized. Please restart the server."
         print(error_msg)
-        return {"answer": error_msg, "images": [], "video": None, "error": error_msg}
+        return {"answer": error_msg, "images": [], "video": None, "error": error_msg}, None
 
-    # Check if the textbook_knowledge collection exists
-    if not hm.check_collection_exists("textbook_knowledge"):
-        error_msg = "ERROR: Collection 'textbook_knowledge' not found. Please run the ingest script first to populate the database."
-        print(error_msg)
-        return {"answer": error_msg, "images": [], "video": None, "error": error_msg}
+    # Check if the textbook collections exist
+    for collection_name in (hm.TEXT_COLLECTION, hm.KNOWLEDGE_COLLECTION):
+        if not await asyncio.to_thread(hm.check_collection_exists, collection_name):
+            error_msg = f"ERROR: Collection '{collection_name}' not found. Please run the ingest script first to populate the database."
+            print(error_msg)
+            return {"answer": error_msg, "images": [], "video": None, "error": error_msg}, None
 
     # 1. RAG SEARCH
     context_text = ""
     images = []
+    image_task = None
     
     try:
-        vector = hm.encoder.encode(user_query).tolist()
+        # Embed the topic alone: the shared difficulty suffix would make every
+        # query look alike. The level is matched exactly by the cache instead.
+        topic, level = split_level(user_query)
+        # Submit the CLIP encode now, so both encodes share one batch window
+        image_task = asyncio.create_task(find_textbook_images(topic, limit=2))
+        vector = await encode_query(topic)
         print(f"Encoded query vector (length: {len(vector)})")
+
+        # Already unit-length (normalized once in encode_batch)
+        unit_vector = np.asarray(vector, dtype=np.float32)
+        cached = lookup_semantic_cache(unit_vector, request.language, level)
+        if cached is not None:
+            print("Semantic cache hit, reusing previous lesson")
+            image_task.cancel()
+            run_in_background(hm.log_activity_to_qdrant, user_query, cached["answer"], vector)
+            return cached, None
         
-        # A. Text Context Search
-        try:
-            # We search for everything, then filter for text
-            search_results = hm.client.search(
-                collection_name="textbook_knowledge", query_vector=vector, limit=5, with_payload=True
-            )
-            for res in search_results:
-                if res.payload.get('type') == 'text':
-                    context_text += res.payload.get('content', '') + "\n\n"
-        except Exception as e:
-            print(f"WARNING: Text search failed: {e}")
+        # A. Text Context (MiniLM) + B. Image Search (CLIP), run concurrently.
+        # They hit different collections with different query vectors, so they
+        # cannot share a single search_batch request.
+        text_payloads, img_payloads = await asyncio.gather(
+            asyncio.to_thread(hm.search_text, vector, limit=5),
+            image_task,
+        )
+        for payload in text_payloads:
+            context_text += payload.get('content', '') + "\n\n"
+        print(f"Found {len(img_payloads)} images in the textbook")
 
-        # B. Image Search (Explicit)
-        try:
-            img_payloads = hm.search_images(vector, limit=2)
-            print(f"Found {len(img_payloads)} images via explicit search")
-            
-            for payload in img_payloads:
-                img_path = payload.get('image_path')
-                if img_path and img_path not in [img['path'] for img in images]:
-                    images.append({"path": img_path, "description": payload.get('content', '')})
-            
-            # C. Web Image Fallback (If not enough local images)
-            if len(images) < 2:
-                print("Not enough local images, searching web...")
-                web_images = get_google_images(user_query)
-                for img in web_images:
-                    if len(images) >= 3: break # Limit total images
-                    images.append(img)
-                    
-        except Exception as e:
-            print(f"WARNING: Image specific search failed: {e}")
+        for payload in img_payloads:
+            img_path = payload.get('image_path')
+            if img_path and img_path not in [img['path'] for img in images]:
+                images.append({"path": img_path, "description": payload.get('content', '')})
 
     except Exception as e:
+        if image_task is not None:
+            image_task.cancel()
         error_msg = f"ERROR: Encoding or DB error: {str(e)}"
         print(error_msg)
-        return {"answer": f"Failed to process query: {str(e)}", "images": [], "video": None, "error": error_msg}
+        return {"answer": f"Failed to process query: {str(e)}", "images": [], "video": None, "error": error_msg}, None
 
     if not context_text:
         context_text = "No specific context found in the textbook."
         print("WARNING: No relevant text found in the book. AI will use general knowledge.")
 
-    # 2. AI GENERATION
+    # 2. AI PROMPT
     system_prompt = f"""
     You are an expert, encouraging AI Tutor. 
     Explain "{user_query}" in {request.language}.
@@ -150,37 +368,163 @@ async def get_lesson(request: QueryRequest):
     Context from Textbook:
     {context_text[:3000]}
     """
-    try:
-        chat = groq_client.chat.completions.create(
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_query}],
-            model="llama-3.3-70b-versatile",
-        )
-        answer = chat.choices[0].message.content
-        print("AI response generated successfully")
-    except Exception as e:
-        error_msg = f"ERROR: AI generation failed: {str(e)}"
-        print(error_msg)
-        answer = f"I'm having trouble thinking right now. Error: {str(e)}"
+    lesson = {
+        "messages": [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_query}],
+        "images": images,
+        "vector": vector,
+        "unit_vector": unit_vector,
+        "level": level,
+    }
+    return None, lesson
+
+async def fetch_media(user_query, images):
+    """Finds the video and, if the textbook had too few diagrams, web images.
+
+    Returns (images, video_data).
+    """
+    # Web image fallback only if the textbook had too few diagrams
+    if len(images) < 2:
+        web_task = fetch_web_images(user_query)
+    else:
+        web_task = asyncio.sleep(0, result=[])
+
+    video_data, web_images = await asyncio.gather(fetch_video(user_query), web_task)
+    images = list(images)
+    for img in web_images:
+        if len(images) >= 3: break # Limit total images
+        images.append(img)
+    return images[:2], video_data
 
-    # 3. VIDEO & HISTORY
+def finish_lesson(request, lesson, answer, generated, images, video_data):
+    """Logs the interaction, caches successful lessons and builds the response."""
+    # HISTORY (does not delay the response)
+    run_in_background(hm.log_activity_to_qdrant, request.query, answer, lesson["vector"])
+
+    response = {"answer": answer, "images": images, "video": video_data}
+    # Only successful generations are worth replaying
+    if generated:
+        store_semantic_cache(lesson["unit_vector"], request.language, lesson["level"], request.query, response)
+    return response
+
+async def build_lesson(request):
+    """Runs the search + generation pipeline for one lesson."""
+    response, lesson = await prepare_lesson(request)
+    if response is not None:
+        return response
+
+    # 3. LLM, VIDEO & WEB IMAGES (run concurrently)
+    (answer, generated), (images, video_data) = await asyncio.gather(
+        generate_answer(lesson["messages"]),
+        fetch_media(request.query, lesson["images"]),
+    )
+    return finish_lesson(request, lesson, answer, generated, images, video_data)
+
+def sse_event(data):
+    """Frames one Server-Sent Event carrying a JSON payload."""
+    return b"data: " + orjson.dumps(data) + b"\n\n"
+
+class LessonBroadcast:
+    """One streamed lesson, replayed to every client that asked the same question."""
+
+    def __init__(self):
+        self.events = []  # SSE frames sent so far
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def publish(self, event, done=False):
+        self.events.append(event)
+        self.done = done
+        # Wake the current waiters; later ones wait on a fresh event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self):
+        """Yields every event from the start, then new ones as they arrive."""
+        sent = 0
+        while True:
+            while sent < len(self.events):
+                yield self.events[sent]
+                sent += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+async def stream_lesson_events(request, broadcast):
+    """Runs the lesson pipeline once, publishing its SSE events to `broadcast`."""
     try:
-        video_data = get_relevant_video(user_query, YOUTUBE_API_KEY)
-        hm.log_activity_to_qdrant(user_query, answer)
-    except Exception as e:
-        print(f"WARNING: Error in video/history: {e}")
-        video_data = None
+        response, lesson = await prepare_lesson(request)
+        if response is not None:
+            broadcast.publish(sse_event({"type": "done", **response}), done=True)
+            return
 
-    return {"answer": answer, "images": images[:2], "video": video_data}
+        media_task = asyncio.create_task(fetch_media(request.query, lesson["images"]))
+        try:
+            parts = []
+            generated = True
+            try:
+                stream = await async_groq_client.chat.completions.create(
+                    messages=lesson["messages"],
+                    model="llama-3.3-70b-versatile",
+                    stream=True,
+                )
+                async for chunk in stream:
+                    token = chunk.choices[0].delta.content if chunk.choices else None
+                    if token:
+                        parts.append(token)
+                        broadcast.publish(sse_event({"type": "token", "content": token}))
+                print("AI response streamed successfully")
+            except Exception as e:
+                print(f"ERROR: AI generation failed: {str(e)}")
+                generated = False
+                parts = [f"I'm having trouble thinking right now. Error: {str(e)}"]
+
+            images, video_data = await media_task
+            response = finish_lesson(request, lesson, "".join(parts), generated, images, video_data)
+            broadcast.publish(sse_event({"type": "done", **response}), done=True)
+        finally:
+            media_task.cancel()
+    finally:
+        if not broadcast.done:  # unexpected error: don't leave the clients waiting
+            error_msg = "ERROR: Lesson generation failed."
+            broadcast.publish(sse_event({"type": "done", "answer": error_msg, "images": [], "video": None, "error": error_msg}), done=True)
+
+# Identical streams already in progress: sha1(query|language) -> LessonBroadcast
+inflight_streams = {}
+
+@app.post("/stream-lesson")
+async def stream_lesson(request: QueryRequest):
+    """Streams a lesson as Server-Sent Events.
+
+    Sends {"type": "token", "content": ...} events while the answer is being
+    generated, then a final {"type": "done", ...} event carrying the same fields
+    as /get-lesson (answer, images, video and, on failure, error). Like
+    /get-lesson, concurrent identical questions share one pipeline run: late
+    joiners get the tokens sent so far, then the rest live.
+    """
+    key = hashlib.sha1(f"{request.query}|{request.language}".encode('utf-8')).digest()
+    broadcast = inflight_streams.get(key)
+    if broadcast is None:
+        broadcast = LessonBroadcast()
+        inflight_streams[key] = broadcast
+        # Runs as its own task, so a disconnecting client can't cancel the shared work
+        task = asyncio.create_task(stream_lesson_events(request, broadcast))
+        background_tasks.add(task)  # keep a reference while no client holds one
+        task.add_done_callback(background_tasks.discard)
+        task.add_done_callback(lambda _: inflight_streams.pop(key, None))
+    else:
+        print(f"\nRequest: '{request.query}' (joining identical in-flight stream)")
+
+    return StreamingResponse(broadcast.subscribe(), media_type="text/event-stream")
 
 @app.get("/get-student-history")
 async def get_history():
-    return {"history": hm.get_qdrant_history()}
+    return {"history": await asyncio.to_thread(hm.get_qdrant_history)}
 
 @app.get("/get-student-profile")
 async def get_student_profile():
     """Get comprehensive learning analytics and profile data."""
     try:
-        analytics = hm.analyze_learning_patterns(GROQ_API_KEY)
+        analytics = await asyncio.to_thread(hm.analyze_learning_patterns, GROQ_API_KEY)
         return analytics
     except Exception as e:
         print(f"ERROR in get_student_profile: {e}")
@@ -188,11 +532,11 @@ async def get_student_profile():
 
 @app.get("/get-recommendation")
 async def get_recommendation():
-    return {"suggestion": hm.suggest_next_topic(GROQ_API_KEY)}
+    return {"suggestion": await asyncio.to_thread(hm.suggest_next_topic, GROQ_API_KEY)}
 
 @app.delete("/delete-history/{point_id}")
 async def delete_history(point_id: str):
-    success = hm.delete_history_record(point_id)
+    success = await asyncio.to_thread(hm.delete_history_record, point_id)
     return {"success": success}
 
 @app.post("/get-quiz")
@@ -214,7 +558,8 @@ Return the response in the following JSON format:
 Make sure the JSON is valid and all questions relate to the topic."""
     
     try:
-        chat = groq_client.chat.completions.create(
+        chat = await asyncio.to_thread(
+            groq_client.chat.completions.create,
             messages=[{"role": "user", "content": prompt}], 
             model="llama-3.3-70b-versatile",
             temperature=0.7,
@@ -235,9 +580,14 @@ async def explain_image(file: UploadFile = File(...), user_query: str = Form("An
         if not file.content_type or not file.content_type.startswith('image/'):
             return {"error": "Invalid file type. Please upload an image file (JPEG, PNG, GIF, WebP)."}
         
-        # 2. Read and encode image
-        img_bytes = await file.read()
-        b64_img = encode_image(img_bytes)
+        # 2. Read (in chunks, with a size limit) and encode image
+        buf = bytearray()
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            buf.extend(chunk)
+            if len(buf) > MAX_UPLOAD_BYTES:
+                return {"error": f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB."}
+        img_bytes = bytes(buf)
+        image_url = await asyncio.to_thread(encode_image, img_bytes)
         
         # 3. Define Valid Vision Models (Updated for 2026)
         # Llama 3.2 and Pixtral are deprecated. We use Llama 4 Multimodal models.
@@ -252,12 +602,13 @@ async def explain_image(file: UploadFile = File(...), user_query: str = Form("An
             try:
                 print(f"📷 Analyzing image with model: {model_name}...")
                 
-                chat = groq_client.chat.completions.create(
+                chat = await asyncio.to_thread(
+                    groq_client.chat.completions.create,
                     messages=[{
                         "role": "user", 
                         "content": [
                             {"type": "text", "text": user_query},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64_img}"}}
+                            {"type": "image_url", "image_url": {"url": image_url}}
                         ]
                     }],
                     model=model_name,
@@ -279,4 +630,17 @@ async def explain_image(file: UploadFile = File(...), user_query: str = Form("An
         }
 
     except Exception as e:
-        return {"error": f"Server error processing image: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Server error processing image: {str(e)}"}
+
+if __name__ == "__main__":
+    import uvicorn
+    # uvloop is not available on Windows; fall back to the default asyncio loop there.
+    # Single worker: the embedded Qdrant database can only be opened by one process.
+    uvicorn.run(
+        "main_api:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=1,
+    )
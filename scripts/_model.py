@@ -0,0 +1,107 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import torch
+from sentence_transformers import SentenceTransformer
+
+# Shared encoder loading for every script, so each model is loaded once per process.
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+def _hf_modules(model):
+    """(owner, attribute) pairs of the Hugging Face modules that run the forward pass."""
+    module = model._first_module()
+    # sentence-transformers < 5.4 keeps the HF model in `auto_model`; newer releases (and
+    # the older CLIP wrapper) keep it in `model`, with `auto_model` a read-only alias
+    name = "auto_model" if "auto_model" in module._modules else "model"
+    hf_model = getattr(module, name)
+    if hasattr(hf_model, "text_model") and hasattr(hf_model, "vision_model"):
+        # CLIP: encoding runs the two towers directly, not CLIPModel.forward
+        return [(hf_model, "text_model"), (hf_model, "vision_model")]
+    return [(module, name)]
+
+def _optimize(model):
+    """torch.compile on the GPU, int8 dynamic quantization of the Linear layers on the CPU."""
+    originals = [(owner, name, getattr(owner, name)) for owner, name in _hf_modules(model)]
+    try:
+        for owner, name, module in originals:
+            if DEVICE == "cuda":
+                # dynamic=True: query lengths vary, so avoid one recompile per shape
+                replacement = torch.compile(module, dynamic=True)
+            else:
+                replacement = torch.ao.quantization.quantize_dynamic(
+                    module, {torch.nn.Linear}, dtype=torch.qint8
+                )
+            setattr(owner, name, replacement)
+            # A read-only alias would silently keep the original in use
+            if getattr(owner, name) is not replacement:
+                raise RuntimeError(f"could not replace {type(owner).__name__}.{name}")
+        # Compilation is lazy: warm up here so the first user query isn't slow
+        model.encode("warm up")
+    except Exception as e:
+        print(f"WARNING: Encoder optimization skipped: {e}")
+        for owner, name, module in originals:
+            if getattr(owner, name) is not module:
+                setattr(owner, name, module)
+            elif owner._modules.get(name) not in (None, module):
+                del owner._modules[name]  # the unused copy left behind by a read-only alias
+
+def _load(model_name):
+    """Loads a model on the GPU (in half precision) when one is available."""
+    model = SentenceTransformer(model_name, device=DEVICE)
+    if DEVICE == "cuda":
+        model.half()
+    model.eval()
+    _optimize(model)
+    return model
+
+@lru_cache(maxsize=1)
+def get_encoder():
+    """CLIP (512-d): images and image-search queries."""
+    return _load('clip-ViT-B-32')
+
+@lru_cache(maxsize=1)
+def get_text_encoder():
+    """MiniLM (384-d): text-to-text retrieval."""
+    return _load('all-MiniLM-L6-v2')
+
+# Query embedding cache shared by every caller in the process (SHA-256 of model:text -> vector list)
+EMBEDDING_CACHE_SIZE = 512
+_embedding_cache = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+
+def encode_batch(texts, model="text"):
+    """Encodes several texts with MiniLM ("text") or CLIP ("clip") in one call, reusing cached results.
+
+    Vectors are L2-normalized here, once, so callers can score them with a plain dot product.
+    """
+    keys = [hashlib.sha256(f"{model}:{text}".encode('utf-8')).hexdigest() for text in texts]
+    vectors = [None] * len(texts)
+    with _embedding_cache_lock:
+        for i, key in enumerate(keys):
+            if key in _embedding_cache:
+                _embedding_cache.move_to_end(key)
+                vectors[i] = _embedding_cache[key]
+
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        encoder = get_encoder() if model == "clip" else get_text_encoder()
+        encoded = encoder.encode(
+            [texts[i] for i in missing], batch_size=len(missing), normalize_embeddings=True
+        )
+
+        with _embedding_cache_lock:
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector.tolist()
+                _embedding_cache[keys[i]] = vectors[i]
+            while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+    return vectors
+
+def encode_text(text, model="text"):
+    """Normalized embedding of one text; repeated queries are cached."""
+    return encode_batch([text], model)[0]
+
+def clear_embedding_cache():
+    with _embedding_cache_lock:
+        _embedding_cache.clear()
@@ -0,0 +1,22 @@
+import os
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+
+# Shared database connection for every script. Set QDRANT_URL (e.g. http://localhost:6333,
+# see docker-compose.yml) to use a Qdrant server, which the API and ingest.py can share;
+# otherwise the embedded store is used, which only one process can open at a time.
+
+# Read the project .env here too, so ingest.py and search.py (which don't load it
+# themselves) connect to the same database as the API
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+def get_client(db_path):
+    """Connects to QDRANT_URL over gRPC if set, else opens the embedded database at `db_path`."""
+    url = os.getenv("QDRANT_URL")
+    if url:
+        return QdrantClient(url=url, prefer_grpc=True)
+    return QdrantClient(path=db_path)
+
+def describe(db_path):
+    """Where get_client(db_path) connects, for log messages."""
+    return os.getenv("QDRANT_URL") or os.path.abspath(db_path)
@@ -1,10 +1,21 @@
 import uuid
 import datetime
 import os
+import time
+from collections import Counter, defaultdict
+from functools import lru_cache
 from groq import Groq
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
-from sentence_transformers import SentenceTransformer
+from qdrant_client.http.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue,
+    SearchParams, QuantizationSearchParams, PayloadSchemaType, OrderBy, Direction,
+    IsEmptyCondition, PayloadField
+)
+try:
+    from scripts._model import get_encoder, get_text_encoder, encode_text, clear_embedding_cache
+    from scripts._qdrant import get_client, describe
+except ImportError:  # run from inside scripts/
+    from _model import get_encoder, get_text_encoder, encode_text, clear_embedding_cache
+    from _qdrant import get_client, describe
 
 # --- CONFIGURATION ---
 # Get the project root directory (one level up from scripts/)
@@ -12,33 +23,56 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 DB_PATH = os.path.join(parent_dir, "qdrant_db")
 HISTORY_COLLECTION = "student_history"
+# Re-encoded copy of the history, kept until a migration has fully finished
+HISTORY_MIGRATION_COLLECTION = "student_history_migration"
+KNOWLEDGE_COLLECTION = "textbook_knowledge"  # CLIP (512-d): diagrams
+TEXT_COLLECTION = "textbook_text"  # MiniLM (384-d): textbook paragraphs
+TEXT_VECTOR_SIZE = 384
+
+# Textbook collections are int8-quantized with fp32 originals on disk (see
+# ingest.py): score on the in-RAM int8 vectors only, no rescoring from disk
+KNOWLEDGE_SEARCH_PARAMS = SearchParams(
+    quantization=QuantizationSearchParams(rescore=False)
+)
 
 # ⚠️ GLOBAL VARIABLES (Initially None)
 client = None
-encoder = None
+encoder = None       # CLIP: image search
+text_encoder = None  # MiniLM: text search, history, caches
+_known_collections = set()  # Collection names, cached at init_client()
+_has_query_points = False  # qdrant-client API capability, checked at init_client()
+
+@lru_cache(maxsize=1)
+def _groq(api_key):
+    """One Groq client per key, so calls reuse its pooled HTTPS connections."""
+    return Groq(api_key=api_key)
 
 def init_client():
     """Initializes the Database connection safely."""
-    global client, encoder
+    global client, encoder, text_encoder, _has_query_points
     if client is None:
         try:
-            print(f"Connecting to Qdrant Database at: {os.path.abspath(DB_PATH)}")
-            client = QdrantClient(path=DB_PATH)
+            print(f"Connecting to Qdrant Database at: {describe(DB_PATH)}")
+            client = get_client(DB_PATH)
             print("Qdrant client connected")
+            # query_points replaces search() in newer qdrant-client releases
+            _has_query_points = hasattr(client, "query_points")
+            refresh_known_collections()
             
-            print("Loading AI encoder model...")
-            encoder = SentenceTransformer('clip-ViT-B-32')
-            print("Encoder loaded")
+            print("Loading AI encoder models...")
+            encoder = get_encoder()
+            text_encoder = get_text_encoder()
+            print("Encoders loaded")
             
             init_history_db()
         except Exception as e:
             print(f"ERROR: Initialization Error: {e}")
-            print(f"   Database path: {os.path.abspath(DB_PATH)}")
+            print(f"   Database: {describe(DB_PATH)}")
             raise
 
 def close_client():
     """Closes the connection safely."""
-    global client, encoder
+    global client, encoder, text_encoder
     try:
         if client:
             print("Closing Qdrant Connection...")
@@ -53,44 +87,187 @@ def close_client():
                     print(f"Warning: Error closing client: {e}")
             finally:
                 client = None
+                _known_collections.clear()
         
         # Clean up encoder if needed
-        if encoder is not None:
+        if encoder is not None or text_encoder is not None:
             encoder = None
+            text_encoder = None
+            clear_embedding_cache()
             
     except Exception as e:
         # Ignore all errors during shutdown
         pass
 
+def refresh_known_collections():
+    """Reloads the cached set of collection names from the database."""
+    names = {col.name for col in client.get_collections().collections}
+    _known_collections.clear()
+    _known_collections.update(names)
+
 def init_history_db():
     """Creates the 'student_history' collection if it doesn't exist."""
-    collections = client.get_collections().collections
-    exists = any(col.name == HISTORY_COLLECTION for col in collections)
+    if HISTORY_COLLECTION not in _known_collections:
+        refresh_known_collections()
     
-    if not exists:
+    if HISTORY_COLLECTION not in _known_collections:
         print(f"Creating new collection: {HISTORY_COLLECTION}")
         client.create_collection(
             collection_name=HISTORY_COLLECTION,
-            vectors_config=VectorParams(size=512, distance=Distance.COSINE)
+            vectors_config=VectorParams(size=TEXT_VECTOR_SIZE, distance=Distance.DOT)
+        )
+        _known_collections.add(HISTORY_COLLECTION)
+    # Also runs for a just-created collection: it may replace one dropped by an interrupted migration
+    migrate_history_vectors()
+    backfill_history_epochs()
+    backfill_history_topics()
+
+    # Lets get_qdrant_history fetch the most recent records already sorted
+    client.create_payload_index(
+        collection_name=HISTORY_COLLECTION,
+        field_name="ts_epoch",
+        field_schema=PayloadSchemaType.INTEGER
+    )
+
+def _scroll_all(collection_name, with_vectors=False):
+    """Returns every point of a collection."""
+    records, offset = [], None
+    while True:
+        batch, offset = client.scroll(
+            collection_name=collection_name, limit=256, offset=offset,
+            with_payload=True, with_vectors=with_vectors
+        )
+        records.extend(batch)
+        if offset is None:
+            return records
+
+def migrate_history_vectors():
+    """Re-embeds history created with the old 512-d CLIP / cosine setup using MiniLM + dot product.
+
+    The re-encoded records are written to HISTORY_MIGRATION_COLLECTION before the
+    original collection is dropped, and that copy is only deleted once the
+    records are back in place. An interrupted migration resumes on the next start.
+    """
+    vectors_params = client.get_collection(HISTORY_COLLECTION).config.params.vectors
+    migrated = vectors_params.size == TEXT_VECTOR_SIZE and vectors_params.distance == Distance.DOT
+    has_copy = HISTORY_MIGRATION_COLLECTION in _known_collections
+
+    if migrated and not has_copy:
+        return
+
+    if not migrated:
+        # A copy left next to an unmigrated collection may be incomplete: rebuild it
+        print(f"Migrating {HISTORY_COLLECTION} to {TEXT_VECTOR_SIZE}-d text vectors...")
+        records = _scroll_all(HISTORY_COLLECTION)
+        vectors = text_encoder.encode([r.payload['topic'] for r in records], normalize_embeddings=True) if records else []
+        client.recreate_collection(
+            collection_name=HISTORY_MIGRATION_COLLECTION,
+            vectors_config=VectorParams(size=TEXT_VECTOR_SIZE, distance=Distance.DOT)
         )
+        _known_collections.add(HISTORY_MIGRATION_COLLECTION)
+        if records:
+            client.upsert(
+                collection_name=HISTORY_MIGRATION_COLLECTION,
+                points=[PointStruct(id=r.id, vector=v.tolist(), payload=r.payload)
+                        for r, v in zip(records, vectors)]
+            )
+        # Only now is it safe to drop the original
+        client.recreate_collection(
+            collection_name=HISTORY_COLLECTION,
+            vectors_config=VectorParams(size=TEXT_VECTOR_SIZE, distance=Distance.DOT)
+        )
+    else:
+        print(f"Resuming interrupted migration of {HISTORY_COLLECTION}...")
+
+    # Copy back (upserts by id, so repeating this after a crash is harmless)
+    records = _scroll_all(HISTORY_MIGRATION_COLLECTION, with_vectors=True)
+    if records:
+        client.upsert(
+            collection_name=HISTORY_COLLECTION,
+            points=[PointStruct(id=r.id, vector=r.vector, payload=r.payload) for r in records]
+        )
+    client.delete_collection(HISTORY_MIGRATION_COLLECTION)
+    _known_collections.discard(HISTORY_MIGRATION_COLLECTION)
+    print(f"Migrated {len(records)} history records")
+
+def backfill_history_epochs():
+    """Adds the 'ts_epoch' field to history records logged before it existed."""
+    missing = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key="ts_epoch"))])
+    offset = None
+    while True:
+        batch, offset = client.scroll(
+            collection_name=HISTORY_COLLECTION, scroll_filter=missing,
+            limit=256, offset=offset, with_payload=True
+        )
+        for record in batch:
+            try:
+                logged_at = datetime.datetime.strptime(record.payload['timestamp'], "%Y-%m-%d %H:%M:%S")
+            except (KeyError, TypeError, ValueError) as e:
+                # A malformed legacy record must not stop the API from starting
+                print(f"WARNING: Skipping history record {record.id} without a valid timestamp: {e}")
+                continue
+            client.set_payload(
+                collection_name=HISTORY_COLLECTION,
+                payload={"ts_epoch": int(logged_at.timestamp())},
+                points=[record.id]
+            )
+        if offset is None:
+            break
+
+def clean_topic(topic):
+    """Topic without the difficulty suffix, e.g. 'DNA (Beginner)' -> 'DNA'."""
+    return topic.split('(')[0].strip()
+
+def backfill_history_topics():
+    """Adds the 'topic_clean' and 'date_str' fields to history records logged before they existed."""
+    missing = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key="topic_clean"))])
+    offset = None
+    while True:
+        batch, offset = client.scroll(
+            collection_name=HISTORY_COLLECTION, scroll_filter=missing,
+            limit=256, offset=offset, with_payload=True
+        )
+        for record in batch:
+            try:
+                fields = {
+                    "topic_clean": clean_topic(record.payload['topic']),
+                    "date_str": record.payload['timestamp'][:10]
+                }
+            except (KeyError, TypeError, AttributeError) as e:
+                # A malformed legacy record must not stop the API from starting
+                print(f"WARNING: Skipping history record {record.id} without a valid topic/timestamp: {e}")
+                continue
+            client.set_payload(
+                collection_name=HISTORY_COLLECTION,
+                payload=fields,
+                points=[record.id]
+            )
+        if offset is None:
+            break
 
 def check_collection_exists(collection_name):
     """Check if a collection exists in the database."""
     if not client:
         return False
+    if collection_name in _known_collections:
+        return True
+    # Not seen yet: re-check once in case it was created after startup
     try:
-        collections = client.get_collections().collections
-        return any(col.name == collection_name for col in collections)
+        refresh_known_collections()
+        return collection_name in _known_collections
     except Exception as e:
         print(f"WARNING: Error checking collection: {e}")
         return False
 
-def log_activity_to_qdrant(query, answer):
-    """Saves the student's interaction."""
+def log_activity_to_qdrant(query, answer, vector=None):
+    """Saves the student's interaction. Pass `vector` if the query is already encoded."""
     if not client: return # Safety check
     
-    vector = encoder.encode(query).tolist()
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if vector is None:
+        vector = encode_text(query)
+    # One clock read: the epoch is for sorting/analytics, the string only for display
+    ts_epoch = int(time.time())
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts_epoch))
     point_id = str(uuid.uuid4())
     
     payload = {
@@ -98,7 +275,11 @@ def log_activity_to_qdrant(query, answer):
         "topic": query,
         "summary": answer[:150] + "...",
         "full_answer": answer,
-        "timestamp": timestamp
+        "timestamp": timestamp,
+        "ts_epoch": ts_epoch,
+        # Precomputed for analyze_learning_patterns
+        "topic_clean": clean_topic(query),
+        "date_str": timestamp[:10]
     }
 
     client.upsert(
@@ -111,9 +292,11 @@ def get_qdrant_history(limit=10):
     if not client: return []
     
     try:
+        # Newest first, ordered server-side via the 'ts_epoch' payload index
         result, _ = client.scroll(
             collection_name=HISTORY_COLLECTION,
             limit=limit,
+            order_by=OrderBy(key="ts_epoch", direction=Direction.DESC),
             with_payload=True
         )
         
@@ -126,7 +309,6 @@ def get_qdrant_history(limit=10):
                 "date": point.payload['timestamp']
             })
             
-        history_data.sort(key=lambda x: x['date'], reverse=True)
         return history_data
     except Exception as e:
         print(f"WARNING: Error fetching history: {e}")
@@ -137,23 +319,28 @@ def get_all_history():
     if not client: return []
     
     try:
-        # Get all records (scroll with a large limit)
+        # Get all records (scroll with a large limit), newest first via the 'ts_epoch' index
         result, _ = client.scroll(
             collection_name=HISTORY_COLLECTION,
             limit=1000,  # Large limit to get all records
+            order_by=OrderBy(key="ts_epoch", direction=Direction.DESC),
             with_payload=True
         )
         
         history_data = []
         for point in result:
+            if 'topic_clean' not in point.payload:
+                continue  # malformed legacy record the backfill skipped
             history_data.append({
                 "id": point.id,
                 "topic": point.payload['topic'],
                 "summary": point.payload.get('summary', ''),
-                "date": point.payload['timestamp']
+                "date": point.payload['timestamp'],
+                "ts_epoch": point.payload['ts_epoch'],
+                "topic_clean": point.payload['topic_clean'],
+                "date_str": point.payload['date_str']
             })
             
-        history_data.sort(key=lambda x: x['date'], reverse=True)
         return history_data
     except Exception as e:
         print(f"WARNING: Error fetching all history: {e}")
@@ -174,73 +361,53 @@ def analyze_learning_patterns(groq_api_key):
                 "recommendations": []
             }
         
-        from collections import Counter, defaultdict
-        from datetime import datetime, timedelta
-        
-        # 1. Count topic frequency
+        # 1. Topic frequency, last studied time and activity by date (single pass)
         topic_counts = Counter()
-        topic_last_studied = {}  # Track when each topic was last studied
-        
-        for item in all_history:
-            topic = item['topic'].strip()
-            # Clean topic (remove difficulty level suffix if present)
-            clean_topic = topic.split('(')[0].strip()
-            topic_counts[clean_topic] += 1
-            
-            # Track last studied date
-            try:
-                item_date = datetime.strptime(item['date'], "%Y-%m-%d %H:%M:%S")
-                if clean_topic not in topic_last_studied or item_date > topic_last_studied[clean_topic]:
-                    topic_last_studied[clean_topic] = item_date
-            except:
-                pass
-        
-        # 2. Activity by date
+        topic_last_studied = {}  # topic -> epoch seconds of the latest session
         activity_by_date = defaultdict(int)
+        
         for item in all_history:
-            try:
-                date_str = item['date'].split(' ')[0]  # Get just the date part
-                activity_by_date[date_str] += 1
-            except:
-                pass
+            # Topic without the difficulty suffix and the day, both stored at log time
+            topic = item['topic_clean']
+            topic_counts[topic] += 1
+            # History is newest first, so the first time a topic is seen is its latest session
+            topic_last_studied.setdefault(topic, item['ts_epoch'])
+            activity_by_date[item['date_str']] += 1
         
-        # 3. Identify weak topics (studied once or not in last 7 days)
+        # 2. Identify weak topics (studied once or not in last 7 days)
         weak_topics = []
         strong_topics = []
-        today = datetime.now()
-        seven_days_ago = today - timedelta(days=7)
+        now = time.time()
         
         for topic, count in topic_counts.items():
-            last_studied = topic_last_studied.get(topic)
-            days_since = None
-            
-            if last_studied:
-                days_since = (today - last_studied).days
+            last_studied = topic_last_studied[topic]
+            days_since = int((now - last_studied) // 86400)
+            last_studied_str = datetime.datetime.fromtimestamp(last_studied).strftime("%Y-%m-%d")
             
             # Weak topic if: studied only once OR not studied in last 7 days
             if count == 1 or (days_since and days_since > 7):
                 weak_topics.append({
                     "topic": topic,
                     "count": count,
-                    "last_studied": last_studied.strftime("%Y-%m-%d") if last_studied else "Never",
+                    "last_studied": last_studied_str,
                     "days_ago": days_since if days_since else "N/A"
                 })
             elif count >= 3 and (not days_since or days_since <= 7):
                 strong_topics.append({
                     "topic": topic,
                     "count": count,
-                    "last_studied": last_studied.strftime("%Y-%m-%d") if last_studied else "Never"
+                    "last_studied": last_studied_str
                 })
         
         # Sort weak topics by priority (older and fewer studies first)
         weak_topics.sort(key=lambda x: (x['count'], x['days_ago'] if isinstance(x['days_ago'], int) else 999))
         
-        # 4. Generate AI recommendations for weak topics
+        # 3. Generate AI recommendations for weak topics
         recommendations = []
         if weak_topics and groq_api_key:
             try:
                 weak_topic_names = [t['topic'] for t in weak_topics[:5]]  # Top 5 weak topics
-                groq_client = Groq(api_key=groq_api_key)
+                groq_client = _groq(groq_api_key)
                 
                 prompt = f"""Based on the student's learning history, they have weak understanding in these topics: {', '.join(weak_topic_names)}.
 
@@ -261,7 +428,7 @@ Keep it brief and motivational."""
                 print(f"Warning: Could not generate AI recommendations: {e}")
                 recommendations = ["Review your weak topics regularly", "Practice active recall"]
         
-        # 5. Prepare data for charts
+        # 4. Prepare data for charts
         sorted_activity = sorted(activity_by_date.items())
         activity_labels = [item[0] for item in sorted_activity]
         activity_values = [item[1] for item in sorted_activity]
@@ -311,6 +478,26 @@ def delete_history_record(point_id):
         print(f"WARNING: Error deleting history: {e}")
         return False
 
+def _vector_search(collection_name, query_vector, limit, query_filter=None):
+    """Runs a textbook search with whichever API the installed qdrant-client has."""
+    if _has_query_points:
+        return client.query_points(
+            collection_name=collection_name,
+            query=query_vector,
+            query_filter=query_filter,
+            limit=limit,
+            search_params=KNOWLEDGE_SEARCH_PARAMS,
+            with_payload=True
+        ).points
+    return client.search(
+        collection_name=collection_name,
+        query_vector=query_vector,
+        query_filter=query_filter,
+        limit=limit,
+        search_params=KNOWLEDGE_SEARCH_PARAMS,
+        with_payload=True
+    )
+
 def search_images(query_vector, limit=2):
     """Searches specifically for images in the knowledge base."""
     if not client: return []
@@ -326,19 +513,24 @@ def search_images(query_vector, limit=2):
             ]
         )
         
-        search_results = client.search(
-            collection_name="textbook_knowledge",
-            query_vector=query_vector,
-            query_filter=img_filter,
-            limit=limit,
-            with_payload=True
-        )
+        search_results = _vector_search(KNOWLEDGE_COLLECTION, query_vector, limit, img_filter)
         
         return [res.payload for res in search_results]
     except Exception as e:
         print(f"WARNING: Image search failed: {e}")
         return []
 
+def search_text(query_vector, limit=5):
+    """Searches the textbook paragraphs (MiniLM vectors)."""
+    if not client: return []
+
+    try:
+        search_results = _vector_search(TEXT_COLLECTION, query_vector, limit)
+        return [res.payload for res in search_results]
+    except Exception as e:
+        print(f"WARNING: Text search failed: {e}")
+        return []
+
 def suggest_next_topic(groq_api_key):
     """Analyzes history to suggest next topic."""
     try:
@@ -347,7 +539,7 @@ def suggest_next_topic(groq_api_key):
             return "Start by asking about 'Cell Structure' or 'DNA'!"
 
         topics_str = ", ".join([item['topic'] for item in recent_history])
-        client_groq = Groq(api_key=groq_api_key)
+        client_groq = _groq(groq_api_key)
         
         prompt = f"""
         The student has recently studied: {topics_str}.
@@ -1,10 +1,16 @@
 import os
+import sys
 import json
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
 import fitz  # PyMuPDF
-from qdrant_client import QdrantClient
 from qdrant_client.http import models
-from sentence_transformers import SentenceTransformer
 from PIL import Image
+try:
+    from scripts._qdrant import get_client, describe
+except ImportError:  # run from inside scripts/
+    from _qdrant import get_client, describe
 
 
 
@@ -18,30 +24,93 @@ PDF_FOLDER = os.path.join(DATA_PATH, "pdf")
 IMAGE_FOLDER = os.path.join(DATA_PATH, "images")
 METADATA_FILE = os.path.join(DATA_PATH, "image_metadata.json")
 DB_PATH = os.path.join(parent_dir, "qdrant_db")  # This folder will be created automatically
+# Image filenames already in KNOWLEDGE_COLLECTION, so re-runs only encode new diagrams
+MANIFEST_FILE = os.path.join(parent_dir, "ingested.json")
 
-KNOWLEDGE_COLLECTION = "textbook_knowledge"
+KNOWLEDGE_COLLECTION = "textbook_knowledge"  # CLIP vectors of the diagrams
+TEXT_COLLECTION = "textbook_text"  # MiniLM vectors of the paragraphs
 MEMORY_COLLECTION = "student_memory"
 
 # --- 1. INITIALIZE RESOURCES ---
-print("Initializing Qdrant and AI Model...")
+# Loaded in init_resources() (main process only): PDF worker processes import
+# this module too and must not open the database or load the models, or even
+# import torch (spawn/forkserver workers re-import this module from scratch).
+client = None
+encoder = None
+text_encoder = None
 
-# Initialize Qdrant (Local Persistence)
-client = QdrantClient(path=DB_PATH)
+def init_resources():
+    global client, encoder, text_encoder
+    try:
+        from scripts._model import get_encoder, get_text_encoder
+    except ImportError:  # run from inside scripts/
+        from _model import get_encoder, get_text_encoder
+    print("Initializing Qdrant and AI Model...")
 
-# Load CLIP Model (Multimodal)
-# This downloads about ~600MB the first time you run it
-encoder = SentenceTransformer('clip-ViT-B-32')
+    # Initialize Qdrant (QDRANT_URL server, or local persistence)
+    client = get_client(DB_PATH)
 
-def create_collections():
-    """Creates the empty database buckets."""
+    # Load CLIP Model (Multimodal)
+    # This downloads about ~600MB the first time you run it
+    encoder = get_encoder()
+    # Text-only model for paragraph retrieval (384-d, much faster than CLIP on text)
+    text_encoder = get_text_encoder()
+
+# int8 copies kept in RAM for fast scoring
+QUANTIZATION_CONFIG = models.ScalarQuantization(
+    scalar=models.ScalarQuantizationConfig(
+        type=models.ScalarType.INT8,
+        quantile=0.99,
+        always_ram=True
+    )
+)
+
+def load_manifest():
+    """Returns the set of image filenames already uploaded, or an empty set."""
+    if not os.path.exists(MANIFEST_FILE):
+        return set()
+    # A manifest without its collection (e.g. the database was deleted) is stale
+    if KNOWLEDGE_COLLECTION not in {col.name for col in client.get_collections().collections}:
+        return set()
+    with open(MANIFEST_FILE, "r") as f:
+        return set(json.load(f))
+
+def save_manifest(filenames):
+    with open(MANIFEST_FILE, "w") as f:
+        json.dump(sorted(filenames), f, indent=2)
+
+def create_collections(keep_images=False):
+    """Creates the empty database buckets.
+
+    Every vector is L2-normalized before upload, so DOT ranks exactly like COSINE
+    without re-normalizing on each comparison. With `keep_images`, the existing
+    diagram collection is left alone so only new images get encoded.
+    """
     # 1. Knowledge Base
-    print(f"   Creating collection: {KNOWLEDGE_COLLECTION}")
+    if keep_images:
+        print(f"   Keeping collection: {KNOWLEDGE_COLLECTION}")
+    else:
+        print(f"   Creating collection: {KNOWLEDGE_COLLECTION}")
+        client.recreate_collection(
+            collection_name=KNOWLEDGE_COLLECTION,
+            vectors_config=models.VectorParams(
+                size=512,  # Matches CLIP model size
+                distance=models.Distance.DOT,
+                on_disk=True  # fp32 originals stay on disk; search uses the int8 copy in RAM
+            ),
+            quantization_config=QUANTIZATION_CONFIG
+        )
+        if os.path.exists(MANIFEST_FILE):
+            os.remove(MANIFEST_FILE)
+    print(f"   Creating collection: {TEXT_COLLECTION}")
     client.recreate_collection(
-        collection_name=KNOWLEDGE_COLLECTION,
+        collection_name=TEXT_COLLECTION,
         vectors_config=models.VectorParams(
-            size=512,  # Matches CLIP model size
-            distance=models.Distance.COSINE
-        )
+            size=384,  # Matches MiniLM model size
+            distance=models.Distance.DOT,
+            on_disk=True  # fp32 originals stay on disk; search uses the int8 copy in RAM
+        ),
+        quantization_config=QUANTIZATION_CONFIG
     )
     # 2. Memory (Chat History)
     print(f"   Creating collection: {MEMORY_COLLECTION}")
@@ -49,19 +118,59 @@ def create_collections():
         collection_name=MEMORY_COLLECTION,
         vectors_config=models.VectorParams(
             size=512,
-            distance=models.Distance.COSINE
+            distance=models.Distance.DOT
         )
     )
 
 # --- 2. PROCESS PDFS ---
-def process_pdfs():
+CHUNK_TARGET_CHARS = 500
+
+def _extract_chunks(pdf_path):
+    """Returns [(chunk_text, payload), ...] for one PDF. Runs in a worker process."""
+    pdf_file = os.path.basename(pdf_path)
+    print(f"   Processing: {pdf_file}")
+    results = []
+
+    try:
+        doc = fitz.open(pdf_path)
+        for page_num, page in enumerate(doc):
+            # MuPDF already segments the page into blocks: (x0, y0, x1, y1, text, block_no, block_type)
+            # Short adjacent blocks are merged into ~CHUNK_TARGET_CHARS chunks
+            page_chunks = []
+            chunk = ""
+            for block in page.get_text("blocks"):
+                text = block[4].strip()
+                if block[6] != 0 or not text:  # skip image blocks
+                    continue
+                chunk = f"{chunk}\n{text}" if chunk else text
+                if len(chunk) >= CHUNK_TARGET_CHARS:
+                    page_chunks.append(chunk)
+                    chunk = ""
+            if len(chunk) > 50:
+                page_chunks.append(chunk)
+
+            # One extend per page instead of growing the result list chunk by chunk
+            results.extend(
+                (c, {"type": "text", "content": c, "page": page_num + 1, "source": pdf_file})
+                for c in page_chunks
+            )
+    except Exception as e:
+        print(f"ERROR: Error reading {pdf_file}: {e}")
+    return results
+
+def parse_pdfs():
+    """Returns (chunks, payloads) for all PDF paragraphs.
+
+    Call before init_resources(): the worker processes must not be forked from a
+    process that already holds a CUDA context or a gRPC channel.
+    """
     print("Processing PDFs...")
-    points = []
-    chunk_id = 0
+    chunks = []
+    payloads = []
 
     if not os.path.exists(PDF_FOLDER):
         print(f"ERROR: PDF Folder not found at {PDF_FOLDER}")
-        return [], 0
+        return [], []
 
     # Find all PDFs
     pdf_files = [f for f in os.listdir(PDF_FOLDER) if f.endswith('.pdf')]
@@ -69,99 +178,125 @@ def process_pdfs():
     if not pdf_files:
         print("WARNING: No PDF files found in data/pdfs/")
 
-    for pdf_file in pdf_files:
-        path = os.path.join(PDF_FOLDER, pdf_file)
-        print(f"   Processing: {pdf_file}")
-        
-        try:
-            doc = fitz.open(path)
-            for page_num, page in enumerate(doc):
-                text = page.get_text()
-                # Split by paragraphs (double newline)
-                chunks = [c.strip() for c in text.split('\n\n') if len(c.strip()) > 50]
-                
-                for chunk in chunks:
-                    vector = encoder.encode(chunk).tolist()
-                    points.append(models.PointStruct(
-                        id=chunk_id,
-                        vector=vector,
-                        payload={
-                            "type": "text",
-                            "content": chunk,
-                            "page": page_num + 1,
-                            "source": pdf_file
-                        }
-                    ))
-                    chunk_id += 1
-        except Exception as e:
-            print(f"ERROR: Error reading {pdf_file}: {e}")
-
-    print(f"   Extracted {len(points)} text chunks.")
-    return points, chunk_id
+    # Parse the PDFs in parallel (CPU-bound); encode_chunks() encodes them later in batches
+    if pdf_files:
+        pdf_paths = [os.path.join(PDF_FOLDER, f) for f in pdf_files]
+        with ProcessPoolExecutor(max_workers=min(len(pdf_paths), os.cpu_count() or 1)) as executor:
+            pairs = list(chain.from_iterable(executor.map(_extract_chunks, pdf_paths)))
+        if pairs:
+            chunks, payloads = map(list, zip(*pairs))
+
+    print(f"   Extracted {len(chunks)} text chunks.")
+    return chunks, payloads
+
+def encode_chunks(chunks):
+    """Returns the MiniLM vectors of the parsed PDF chunks, or None if there are none."""
+    if not chunks:
+        return None
+
+    print("   Encoding text chunks...")
+    return text_encoder.encode(
+        chunks, batch_size=64, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=True
+    )
 
 # --- 3. PROCESS IMAGES ---
-def process_images(start_id):
+def process_images(skip=()):
+    """Returns (clip_vectors, payloads) for the listed images not in `skip`."""
     print("Processing Images...")
-    points = []
-    current_id = start_id
+    images = []
+    payloads = []
 
     if not os.path.exists(METADATA_FILE):
         print(f"WARNING: Metadata file missing: {METADATA_FILE}")
-        return []
+        return None, []
 
     with open(METADATA_FILE, "r") as f:
         metadata = json.load(f)
 
     for item in metadata:
         filename = item["filename"]
+        if filename in skip:
+            continue
         description = item["description"]
         img_path = os.path.join(IMAGE_FOLDER, filename)
 
         if os.path.exists(img_path):
             try:
-                # Open Image
-                image = Image.open(img_path)
-                # Convert Image to Vector (The Magic Part)
-                vector = encoder.encode(image).tolist()
-                
-                points.append(models.PointStruct(
-                    id=current_id,
-                    vector=vector,
-                    payload={
-                        "type": "image",
-                        "content": description,
-                        "image_path": img_path, # Path for Streamlit to display
-                        "source": filename,
-                        "page": 0 
-                    }
-                ))
-                current_id += 1
-                print(f"   Ingested: {filename}")
+                # Open Image (fully loaded so the file handle can be released)
+                images.append(Image.open(img_path).convert("RGB"))
+                payloads.append({
+                    "type": "image",
+                    "content": description,
+                    "image_path": img_path, # Path for Streamlit to display
+                    "source": filename,
+                    "page": 0 
+                })
+                print(f"   Loaded: {filename}")
             except Exception as e:
                 print(f"ERROR: Error with {filename}: {e}")
         else:
             print(f"WARNING: Image not found: {filename}")
 
-    return points
+    if not images:
+        return None, []
+
+    # Convert all Images to Vectors in one batch (The Magic Part)
+    vectors = encoder.encode(
+        images, batch_size=32, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=True
+    )
+    return vectors, payloads
+
+# --- 4. BULK UPLOAD ---
+UPLOAD_BATCH_SIZE = 256
+UPLOAD_PARALLEL = max(1, (os.cpu_count() or 2) // 2)
+
+def bulk_upload(collection_name, vectors, payloads, ids=None):
+    """Uploads vectors in parallel batches with HNSW indexing paused until the end."""
+    # Building the index point-by-point during a bulk load is wasted work
+    client.update_collection(
+        collection_name=collection_name,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0)
+    )
+    client.upload_collection(
+        collection_name=collection_name,
+        vectors=vectors,
+        payload=payloads,
+        ids=ids if ids is not None else list(range(len(payloads))),
+        batch_size=UPLOAD_BATCH_SIZE,
+        parallel=UPLOAD_PARALLEL
+    )
+    client.update_collection(
+        collection_name=collection_name,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=20000)
+    )
 
 # --- MAIN EXECUTION ---
 if __name__ == "__main__":
-    create_collections()
+    # Parse first: the PDF workers fork before any model or database connection exists
+    chunks, text_payloads = parse_pdfs()
+
+    init_resources()
+    # Pass --rebuild to re-encode every image instead of only the new ones
+    ingested = set() if "--rebuild" in sys.argv else load_manifest()
+    create_collections(keep_images=bool(ingested))
     
     # Run Processing
-    text_data, last_id = process_pdfs()
-    image_data = process_images(start_id=last_id)
-    
-    all_data = text_data + image_data
+    text_vectors = encode_chunks(chunks)
+    image_vectors, image_payloads = process_images(skip=ingested)
+    if ingested:
+        print(f"   Skipped {len(ingested)} already ingested images.")
 
     # Upload to Qdrant
-    if all_data:
-        print(f"Uploading {len(all_data)} items to database...")
-        client.upsert(
-            collection_name=KNOWLEDGE_COLLECTION,
-            points=all_data
-        )
+    if text_payloads or image_payloads:
+        print(f"Uploading {len(text_payloads) + len(image_payloads)} items to database...")
+        if text_payloads:
+            bulk_upload(TEXT_COLLECTION, text_vectors, text_payloads)
+        if image_payloads:
+            # Ids derived from the filename, so incremental runs never overwrite older diagrams
+            image_ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, p["source"])) for p in image_payloads]
+            bulk_upload(KNOWLEDGE_COLLECTION, image_vectors, image_payloads, ids=image_ids)
+            save_manifest(ingested | {p["source"] for p in image_payloads})
         print("SUCCESS! Database is ready.")
-        print(f"   - Database location: {os.path.abspath(DB_PATH)}")
+        print(f"   - Database location: {describe(DB_PATH)}")
     else:
-        print("WARNING: No data was found. Check your folders!")
\ No newline at end of file
+        print("WARNING: No data was found. Check your folders!")
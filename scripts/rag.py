@@ -1,8 +1,13 @@
 import os
 import sys
 from dotenv import load_dotenv # Import this to read .env
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
+from qdrant_client.http import models
+try:
+    from scripts._model import get_text_encoder, encode_text
+    from scripts._qdrant import get_client
+except ImportError:  # run from inside scripts/
+    from _model import get_text_encoder, encode_text
+    from _qdrant import get_client
 from groq import Groq
 
 # --- 1. LOAD SECRETS ---
@@ -23,14 +28,18 @@ if not api_key:
 
 # --- 2. CONFIGURATION ---
 DB_PATH = os.path.join(parent_dir, "qdrant_db")
-COLLECTION_NAME = "textbook_knowledge"
+COLLECTION_NAME = "textbook_text"  # MiniLM paragraph vectors
+# int8-quantized, fp32 on disk: approximate int8 scores are good enough here
+SEARCH_PARAMS = models.SearchParams(
+    quantization=models.QuantizationSearchParams(rescore=False)
+)
 
 # --- 3. INITIALIZE ---
 print("🚀 Loading AI Brain...")
 try:
     # Initialize Clients
-    client = QdrantClient(path=DB_PATH)
-    encoder = SentenceTransformer('clip-ViT-B-32')
+    client = get_client(DB_PATH)
+    get_text_encoder()  # Load now so the first question is fast
     groq_client = Groq(api_key=api_key)
 except Exception as e:
     print(f"❌ Initialization Error: {e}")
@@ -42,13 +51,14 @@ def get_answer(query):
 
     # A. RETRIEVE (Search Qdrant for Book Context)
     try:
-        vector = encoder.encode(query).tolist()
+        vector = encode_text(query)
         
         # Search Qdrant
         search_result = client.query_points(
             collection_name=COLLECTION_NAME,
             query=vector,
             limit=3,
+            search_params=SEARCH_PARAMS,
             with_payload=True
         )
         results = search_result.points
@@ -104,7 +114,7 @@ def get_answer(query):
         print("\n" + "="*40)
         print(f"🎓 AI ANSWER:\n{ai_answer}")
         print("="*40)
-        unique_sources = sorted(list(set(sources)))
+        unique_sources = list(dict.fromkeys(sources))  # de-dup, keeping relevance order
         print(f"📚 Sources: {', '.join(unique_sources)}")
         
     except Exception as e:
@@ -1,55 +1,65 @@
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
+from qdrant_client.http import models
+try:
+    from scripts._model import get_encoder, get_text_encoder, encode_text
+    from scripts._qdrant import get_client
+except ImportError:  # run from inside scripts/
+    from _model import get_encoder, get_text_encoder, encode_text
+    from _qdrant import get_client
 
 # --- CONFIGURATION ---
 DB_PATH = "../qdrant_db"
-COLLECTION_NAME = "textbook_knowledge"
+TEXT_COLLECTION = "textbook_text"  # MiniLM paragraph vectors
+IMAGE_COLLECTION = "textbook_knowledge"  # CLIP diagram vectors
+# int8-quantized, fp32 on disk: approximate int8 scores are good enough here
+SEARCH_PARAMS = models.SearchParams(
+    quantization=models.QuantizationSearchParams(rescore=False)
+)
 
 # --- INITIALIZE ---
 print("🚀 Loading Search Engine...")
 try:
-    client = QdrantClient(path=DB_PATH)
-    encoder = SentenceTransformer('clip-ViT-B-32')
+    client = get_client(DB_PATH)
+    # Load now so the first search is fast
+    get_text_encoder()  # Text queries vs. paragraphs
+    get_encoder()  # CLIP text tower vs. diagrams
 except Exception as e:
     print(f"❌ Initialization Error: {e}")
     exit()
 
-def search(query):
-    print(f"\n🔎 Searching for: '{query}'...")
-    
-    vector = encoder.encode(query).tolist()
-    
-    # 1. Fetch MORE results (Limit 10) so we can filter
-    try:
+# query_points replaces search() in newer qdrant-client releases
+HAS_QUERY_POINTS = hasattr(client, "query_points")
+
+def run_search(collection_name, vector, limit):
+    """Vector search with whichever API the installed qdrant-client has."""
+    if HAS_QUERY_POINTS:
         search_result = client.query_points(
-            collection_name=COLLECTION_NAME,
+            collection_name=collection_name,
             query=vector,
-            limit=10,  # <--- Increased to 10
-            with_payload=True
-        )
-        results = search_result.points
-    except AttributeError:
-        results = client.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=vector,
-            limit=10,
+            limit=limit,
+            search_params=SEARCH_PARAMS,
             with_payload=True
         )
+        return search_result.points
+    return client.search(
+        collection_name=collection_name,
+        query_vector=vector,
+        limit=limit,
+        search_params=SEARCH_PARAMS,
+        with_payload=True
+    )
+
+def search(query):
+    print(f"\n🔎 Searching for: '{query}'...")
+    
+    # 1. Text with MiniLM, diagrams with CLIP (each model against its own collection)
+    try:
+        text_results = run_search(TEXT_COLLECTION, encode_text(query), limit=3)
+        image_results = run_search(IMAGE_COLLECTION, encode_text(query, model="clip"), limit=2)
     except Exception as e:
         print(f"❌ Error: {e}")
         return
 
-    # 2. SEPARATE Text and Images (The "Bucket Strategy")
-    text_results = []
-    image_results = []
-    
-    for res in results:
-        if res.payload['type'] == 'text':
-            text_results.append(res)
-        elif res.payload['type'] == 'image':
-            image_results.append(res)
-
-    # 3. DISPLAY Top 3 Text + Top 2 Images
+    # 2. DISPLAY Top 3 Text + Top 2 Images
     print("\n--- 📄 RELEVANT TEXT (Top 3) ---")
     if not text_results:
         print("   No text found.")
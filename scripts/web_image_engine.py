@@ -1,5 +1,8 @@
 from duckduckgo_search import DDGS
 
+# Seconds before giving up on DuckDuckGo, so a slow search can't hold a lesson open
+SEARCH_TIMEOUT = 5
+
 def get_google_images(query):
     """
     Searches for images using DuckDuckGo (acting as a proxy for web search)
@@ -7,7 +10,7 @@ def get_google_images(query):
     """
     print(f"🌍 Searching Web Images for: {query}")
     try:
-        results = DDGS().images(
+        results = DDGS(timeout=SEARCH_TIMEOUT).images(
             keywords=f"{query} scientific diagram labeled",
             region="wt-wt",
             safesearch="on",
@@ -1,5 +1,21 @@
+import threading
+import httplib2
 from googleapiclient.discovery import build
 
+# Seconds before giving up on the YouTube API
+SEARCH_TIMEOUT = 5
+
+# googleapiclient services are not thread-safe, so each worker thread keeps its own
+_local = threading.local()
+
+def _get_service(api_key):
+    """Builds the YouTube client once per thread and API key."""
+    if getattr(_local, "api_key", None) != api_key:
+        _local.youtube = build('youtube', 'v3', developerKey=api_key,
+                               http=httplib2.Http(timeout=SEARCH_TIMEOUT), cache_discovery=False)
+        _local.api_key = api_key
+    return _local.youtube
+
 def get_relevant_video(query: str, api_key: str):  # <--- This is the missing function
     """
     Searches YouTube for the best educational video.
@@ -9,7 +25,7 @@ def get_relevant_video(query: str, api_key: str):  # <--- This is the missing fu
         return None
 
     try:
-        youtube = build('youtube', 'v3', developerKey=api_key)
+        youtube = _get_service(api_key)
         
         search_query = f"{query} education animation"
         